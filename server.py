@@ -26,6 +26,9 @@ openai.api_key = os.getenv("OPENAI_API_KEY")
 SHOPIFY_ACCESS_TOKEN = os.getenv("SHOPIFY_STOREFRONT_ACCESS_TOKEN")
 SHOPIFY_STORE_DOMAIN = os.getenv("SHOPIFY_STORE_DOMAIN")  # now using the full URL
 
+# ✅ Shared HTTP session so repeat calls reuse keep-alive connections
+http = requests.Session()
+
 @app.get("/")
 def root():
     return {"status": "ok"}
@@ -75,7 +78,7 @@ async def mcp_handler(request: Request):
 
                     if func_name == "getProductDetails":
                         try:
-                            response = requests.post(
+                            response = http.post(
                                 "https://rxshopifympc.onrender.com/get-product-details",
                                 json=args,
                                 timeout=30  # reduced timeout for quicker failure
@@ -160,7 +163,7 @@ async def get_product_details(request: Request):
     }
 
     try:
-        response = requests.post(
+        response = http.post(
             SHOPIFY_STORE_DOMAIN,
             json={"query": query},
             headers=headers,
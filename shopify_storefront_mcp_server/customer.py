@@ -1,36 +1,64 @@
 from __future__ import annotations
 
+import asyncio
 import json
 import os
-from typing import Any, Dict, Optional
+import threading
+from typing import Any, Dict, Optional, Tuple
 
 from . import mcp
-from .utils import ROOT_DIR
+from .utils import ROOT_DIR, json_dumps
+
+
+USER_DATA_DIR = os.path.join(ROOT_DIR, "user_data")
+CUSTOMER_DATA_PATH = os.path.join(USER_DATA_DIR, "customer.json")
+CUSTOMER_DATA_TMP_PATH = CUSTOMER_DATA_PATH + ".tmp"
+os.makedirs(USER_DATA_DIR, exist_ok=True)
+
+# (signature, data) for the last parsed customer.json, keyed by the file's (mtime, size, inode).
+# Swapped as one tuple so a reader never pairs a new signature with old data while a worker thread writes.
+_user_data_cache: Tuple[Optional[Tuple[int, int, int]], Dict[str, Any]] = (None, {})
+
+
+def _file_signature() -> Optional[Tuple[int, int, int]]:
+    try:
+        st = os.stat(CUSTOMER_DATA_PATH)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
 
 
 def load_user_data() -> Dict[str, Any]:
-    """Load user data from the user_data directory."""
-    user_data_path = os.path.join(ROOT_DIR, "user_data")
-    if not os.path.exists(user_data_path):
-        os.makedirs(user_data_path)
-    customer_data_path = os.path.join(user_data_path, "customer.json")
-    if os.path.exists(customer_data_path):
-        with open(customer_data_path, "r") as f:
-            try:
-                return json.load(f)
-            except json.JSONDecodeError:
-                return {}
-    return {}
+    """Load user data from the user_data directory, reparsing only when the file changed."""
+    global _user_data_cache
+    signature = _file_signature()
+    if signature is None:
+        return {}
+    cached_signature, cached_data = _user_data_cache
+    if signature == cached_signature:
+        return cached_data
+    with open(CUSTOMER_DATA_PATH, "rb") as f:
+        try:
+            # Stdlib parser: orjson would turn integers beyond 64 bits into floats. The file is small.
+            data = json.loads(f.read())
+        except ValueError:
+            data = {}
+    _user_data_cache = (signature, data)
+    return data
 
 
 def save_user_data(data: Dict[str, Any]) -> None:
-    """Save user data to the user_data directory."""
-    user_data_path = os.path.join(ROOT_DIR, "user_data")
-    if not os.path.exists(user_data_path):
-        os.makedirs(user_data_path)
-    customer_data_path = os.path.join(user_data_path, "customer.json")
-    with open(customer_data_path, "w") as f:
-        json.dump(data, f, indent=2)
+    """Save user data to the user_data directory, skipping the write if the file already holds ``data``."""
+    global _user_data_cache
+    signature, cached_data = _user_data_cache
+    if signature is not None and data == cached_data and signature == _file_signature():
+        return
+    # Explicit UTF-8: orjson leaves non-ASCII unescaped, and the file is read back as UTF-8 bytes.
+    with open(CUSTOMER_DATA_TMP_PATH, "w", encoding="utf-8") as f:
+        f.write(json_dumps(data, indent=True))
+    os.replace(CUSTOMER_DATA_TMP_PATH, CUSTOMER_DATA_PATH)
+    # Write through so the next resource read skips reparsing the file we just wrote.
+    _user_data_cache = (_file_signature(), data)
 
 
 @mcp.resource(uri="customer://name", name="Customer Name", description="The customer's full name", mime_type="text/plain")
@@ -68,6 +96,59 @@ def customer_profile() -> Dict[str, Any]:
     return load_user_data()
 
 
+def _do_get(data, field, value, shipping_address, billing_address, custom_fields) -> str:
+    if field is None:
+        return json_dumps(data)
+    return json_dumps({"field": field, "value": data.get(field, "")})
+
+
+def _do_update(data, field, value, shipping_address, billing_address, custom_fields) -> str:
+    updates_made = False
+    if field is not None and value is not None:
+        data[field] = value
+        updates_made = True
+    if shipping_address is not None:
+        if "shipping_address" in data and "street" in data["shipping_address"] and "address1" not in shipping_address:
+            shipping_address["address1"] = data["shipping_address"]["street"]
+        data["shipping_address"] = shipping_address
+        updates_made = True
+    if billing_address is not None:
+        if "billing_address" in data and "street" in data["billing_address"] and "address1" not in billing_address:
+            billing_address["address1"] = data["billing_address"]["street"]
+        data["billing_address"] = billing_address
+        updates_made = True
+    if custom_fields is not None:
+        for key, val in custom_fields.items():
+            data[key] = val
+            updates_made = True
+    if updates_made:
+        save_user_data(data)
+        return json_dumps({"status": "success", "message": "Customer data updated", "data": data})
+    return json_dumps({"error": "No updates provided"})
+
+
+def _do_delete(data, field, value, shipping_address, billing_address, custom_fields) -> str:
+    if field is None:
+        save_user_data({})
+        return json_dumps({"status": "success", "message": "All customer data deleted"})
+    if field in data:
+        del data[field]
+        save_user_data(data)
+        return json_dumps({"status": "success", "message": f"Field '{field}' deleted", "data": data})
+    return json_dumps({"status": "warning", "message": f"Field '{field}' not found"})
+
+
+_OPS = {"get": _do_get, "update": _do_update, "delete": _do_delete}
+_ops_lock = threading.Lock()
+
+
+def _run_locked(handler, field, value, shipping_address, billing_address, custom_fields) -> str:
+    with _ops_lock:
+        # Work on a copy so a failed save cannot leave the cached profile half-updated.
+        data = dict(load_user_data())
+        return handler(data, field, value, shipping_address, billing_address, custom_fields)
+
+
 @mcp.tool()
 async def customer_data(
     operation: str,
@@ -78,45 +159,10 @@ async def customer_data(
     custom_fields: Optional[Dict[str, Any]] = None,
 ) -> str:
     """CRUD operations for local customer data."""
-    data = load_user_data()
-
-    if operation.lower() == "get":
-        if field is None:
-            return json.dumps(data)
-        return json.dumps({"field": field, "value": data.get(field, "")})
-
-    elif operation.lower() == "update":
-        updates_made = False
-        if field is not None and value is not None:
-            data[field] = value
-            updates_made = True
-        if shipping_address is not None:
-            if "shipping_address" in data and "street" in data["shipping_address"] and "address1" not in shipping_address:
-                shipping_address["address1"] = data["shipping_address"]["street"]
-            data["shipping_address"] = shipping_address
-            updates_made = True
-        if billing_address is not None:
-            if "billing_address" in data and "street" in data["billing_address"] and "address1" not in billing_address:
-                billing_address["address1"] = data["billing_address"]["street"]
-            data["billing_address"] = billing_address
-            updates_made = True
-        if custom_fields is not None:
-            for key, val in custom_fields.items():
-                data[key] = val
-                updates_made = True
-        if updates_made:
-            save_user_data(data)
-            return json.dumps({"status": "success", "message": "Customer data updated", "data": data})
-        return json.dumps({"error": "No updates provided"})
-
-    elif operation.lower() == "delete":
-        if field is None:
-            save_user_data({})
-            return json.dumps({"status": "success", "message": "All customer data deleted"})
-        if field in data:
-            del data[field]
-            save_user_data(data)
-            return json.dumps({"status": "success", "message": f"Field '{field}' deleted", "data": data})
-        return json.dumps({"status": "warning", "message": f"Field '{field}' not found"})
-
-    return json.dumps({"error": f"Unknown operation: {operation}"})
+    handler = _OPS.get(operation.lower())
+    if handler is None:
+        return json_dumps({"error": f"Unknown operation: {operation}"})
+    # File IO runs off the event loop; the lock keeps concurrent calls from losing each other's updates.
+    return await asyncio.to_thread(
+        _run_locked, handler, field, value, shipping_address, billing_address, custom_fields
+    )
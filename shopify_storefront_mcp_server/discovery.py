@@ -1,189 +1,376 @@
 from __future__ import annotations
 
 import asyncio
-import json
+import os
 import re
 import urllib.parse
-from typing import Any, Dict, List
+from functools import lru_cache
+from html import unescape
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple
 
-from bs4 import BeautifulSoup
+import httpx
 
 from . import mcp
-from .graphql_client import GraphQLClient
+from .graphql_client import RETRY_STATUSES, GraphQLClient
 from .utils import (
+    CACHE_DIR,
     DEFAULT_API_VERSION,
+    DiskCache,
+    TTLCache,
     get_http_client,
+    json_dumps,
 )
 
 # Heuristic patterns for discovery
+# Lowercase ASCII, matching the header names httpx yields.
 HDR_PREFIXES = (
-    "x‑shopify",
-    "x‑shop",
-    "x‑shardid",
-    "x‑sorting-hat",
+    "x-shopify",
+    "x-shop",
+    "x-shardid",
+    "x-sorting-hat",
 )
-HTML_MARKERS = (
-    re.compile(r"cdn\.shopify(?:cdn)?\.net|cdn\.shopify\.com", re.I),
-    re.compile(r"class=[\"'][^\"']*shopify-section", re.I),
-    re.compile(r"window\.Shopify|Shopify\.theme", re.I),
-    re.compile(r"[a-zA-Z0-9-]+\.myshopify\.com", re.I),
+HTML_MARKER_PATTERN = re.compile(
+    r"cdn\.shopify(?:cdn)?\.net|cdn\.shopify\.com"
+    r"|class=[\"'][^\"']*shopify-section"
+    r"|window\.Shopify|Shopify\.theme"
+    r"|[a-zA-Z0-9-]+\.myshopify\.com",
+    re.I,
 )
 
-TOKEN_PATTERNS = [
-    re.compile(r"\b([a-f0-9]{32})\b", re.I),
-    re.compile(r"\b([a-f0-9]{24,64})\b", re.I),
-    re.compile(r"\"(eyJ[a-zA-Z0-9_-]{10,}\.eyJ[a-zA-Z0-9_-]{10,}\.[a-zA-Z0-9_-]{10,})\"", re.I),
-]
+# Hex tokens (the 32-char storefront format included) or quoted JWTs. The
+# possessive quantifiers keep malformed JWT-looking input from backtracking.
+TOKEN_PATTERN = re.compile(
+    r"\b(?P<hex>[a-f0-9]{24,64})\b"
+    r"|\"(?P<jwt>eyJ[a-zA-Z0-9_-]{10,}+\.eyJ[a-zA-Z0-9_-]{10,}+\.[a-zA-Z0-9_-]{10,}+)\"",
+    re.I,
+)
+
+# One pass over the page: Shopify.shop assignment, myshopify_domain config key or any *.myshopify.com host.
+SHOPIFY_HOST_PATTERN = re.compile(
+    r"Shopify\.shop\s*=\s*[\"'](?P<shop>[^\"']+)[\"']"
+    r"|[\"']myshopify_domain[\"']\s*:\s*[\"'](?P<md>[^\"']+)[\"']"
+    r"|(?P<dom>[a-zA-Z0-9][a-zA-Z0-9-]*\.myshopify\.com)",
+    re.I,
+)
 
-MYSHOPIFY_PATTERNS = [
-    re.compile(r"[\"'](https?://)?([a-zA-Z0-9][a-zA-Z0-9-]*\.myshopify\.com)[\"'/]", re.I),
-    re.compile(r"\b(https?://)?([a-zA-Z0-9][a-zA-Z0-9-]*\.myshopify\.com)\b", re.I),
-    re.compile(r"[\"']myshopify_domain[\"']\s*:\s*[\"']([^\"']+)[\"']", re.I),
+# Keywords that must appear near a token match for it to become a candidate.
+TOKEN_CONTEXTS = (
+    "storefront",
+    "token",
+    "access_token",
+    "accesstoken",
+    "apikey",
+    "api_key",
+    "shopify",
+    "graphql",
+    "storefrontaccesstoken",
+    "x-shopify",
+    "publicaccesstoken",
+    "client_id",
+    "clientid",
+)
+TOKEN_CONTEXT_PATTERN = re.compile("|".join(re.escape(ctx) for ctx in TOKEN_CONTEXTS), re.I)
+INIT_PATTERN = re.compile(
+    r"ShopifyBuy\.buildClient\({[^}]*}"
+    r"|createClient\({[^}]*}"
+    r"|Shopify\.loadFeatures\({[^}]*}"
+    r"|new Client\({[^}]*}"
+    r"|fetch\([^)]*\"/api/[^\"]*\""
+)
+# Keywords that name a Storefront token specifically; candidates near them are validated first.
+PRIORITY_CONTEXT_PATTERN = re.compile(
+    r"storefront_?access_?token|public_?access_?token|storefront-access-token", re.I
+)
+# Byte-level twins of the two patterns above, used to prescreen raw asset bodies.
+TOKEN_CONTEXT_BYTES_PATTERN = re.compile(TOKEN_CONTEXT_PATTERN.pattern.encode(), re.I)
+INIT_BYTES_PATTERN = re.compile(INIT_PATTERN.pattern.encode())
+CONFIG_PATTERNS = [
+    re.compile(r"window\.[A-Za-z0-9_]+\s*=\s*({[^;]+});"),
+    re.compile(r"var\s+[A-Za-z0-9_]+\s*=\s*({[^;]+});"),
+    re.compile(r"const\s+[A-Za-z0-9_]+\s*=\s*({[^;]+});"),
+]
+FETCH_PATTERNS = [
+    re.compile(r"fetch\(['\"](https://[^'\"]+graphql[^'\"]*)['\"]"),
+    re.compile(r"url:\s*['\"](https://[^'\"]+graphql[^'\"]*)['\"]"),
+    re.compile(r"endpoint:\s*['\"](https://[^'\"]+graphql[^'\"]*)['\"]"),
 ]
+ASSET_PATTERN = re.compile(r"(cdn\.shopify|/assets/)")
 
+# Tag-level scans over the raw page; these replace walking a parsed DOM.
+JSON_LD_PATTERN = re.compile(
+    r"<script\b[^>]*\btype\s*=\s*[\"']application/ld\+json[\"'][^>]*>(.*?)</script\s*>", re.I | re.S
+)
+META_CONTENT_PATTERN = re.compile(
+    r"<meta\b[^>]*?(?<![\w-])content\s*=\s*(?:\"([^\"]{21,})\"|'([^']{21,})')", re.I
+)
+DATA_ATTR_PATTERN = re.compile(r"(?<![\w-])data-[\w-]+\s*=\s*(?:\"([^\"]{21,})\"|'([^']{21,})')", re.I)
+ASSET_TAG_PATTERN = re.compile(r"<(?:script|link)\b[^>]*?(?<![\w-])(?:src|href)\s*=\s*[\"']([^\"']+)[\"']", re.I)
+
+# (permission name, operation, selection); the name doubles as the field alias.
+PERMISSION_TESTS = (
+    ("unauthenticated_read_product_listings", "query", "products(first:1){edges{node{id}}}"),
+    ("cart_create", "mutation", "cartCreate(input:{}){cart{id}}"),
+    ("unauthenticated_read_content", "query", "shop{name description}"),
+    ("unauthenticated_read_customer", "mutation", "customerAccessTokenCreate(input:{email:\"test@example.com\",password:\"test\"}){customerUserErrors{message}}"),
+    ("unauthenticated_read_collection_listings", "query", "collections(first:1){edges{node{id}}}"),
+    ("product_types_access", "query", "productTypes(first:1){edges{node}}"),
+    ("search_access", "query", "search(query:\"test\",types:PRODUCT,first:1){edges{node{__typename}}}"),
+    ("metafields_access", "query", "shop{metafields(first:1){edges{node{id}}}}"),
+)
+VALIDATION_QUERY_FIELDS = (("schema", "__schema{queryType{name}}"),) + tuple(
+    (name, selection) for name, operation, selection in PERMISSION_TESTS if operation == "query"
+)
+VALIDATION_MUTATION_FIELDS = tuple(
+    (name, selection) for name, operation, selection in PERMISSION_TESTS if operation == "mutation"
+)
 
-async def fetch_text(url: str) -> str:
+# Validation outcomes per (host, token, api_version); network failures are not cached.
+VALIDATION_CACHE_TTL = 600.0
+_validation_cache = TTLCache(VALIDATION_CACHE_TTL, maxsize=1024)
+
+# Serialized shopify_discover results per storefront netloc.
+DISCOVERY_CACHE_TTL = 300.0
+_discovery_cache = TTLCache(DISCOVERY_CACHE_TTL, maxsize=128)
+# The same results persisted across restarts, keyed by both the requested netloc and the canonical host.
+DISCOVERY_DISK_CACHE_TTL = 3600.0
+_discovery_disk_cache = DiskCache(os.path.join(CACHE_DIR, "discovery.sqlite"), DISCOVERY_DISK_CACHE_TTL)
+# Notes marking a discovery as incomplete (transient failures only); such results are never cached.
+UNCACHEABLE_NOTE_PREFIXES = ("asset error", "validation error")
+
+# Token candidates found in each asset URL; Shopify CDN assets are versioned, so their content is stable.
+ASSET_CACHE_TTL = 3600.0
+_asset_candidate_cache = TTLCache(ASSET_CACHE_TTL, maxsize=512)
+
+# Example documents quoted in generate_api_guidance.
+EXAMPLE_PRODUCT_QUERY = "{ products(first: 10) { edges { node { id title variants(first: 1) { edges { node { id } } } } } } }"
+EXAMPLE_CART_CREATE = "mutation { cartCreate( input: { lines: [ { quantity: 1 merchandiseId: \"gid://shopify/ProductVariant/VARIANT_ID\" } ] } ) { cart { id checkoutUrl } } }"
+EXAMPLE_SEARCH_DISCOVERY = "{ productTypes(first: 10) { edges { node } } } { search(query: \"TypeName\", types: [PRODUCT], first: 3) { edges { node { ... on Product { id title variants(first: 1) { edges { node { id } } } } } } } }"
+
+# Upper bound on simultaneous asset downloads per discovery.
+ASSET_CONCURRENCY = 16
+# Assets are best-effort, so a stalled CDN gets less time than a GraphQL call.
+ASSET_TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+# Upper bound on tokens validated at once, to stay clear of Shopify's 430 rejections.
+VALIDATION_CONCURRENCY = 8
+# Hex candidates with fewer distinct characters than this are placeholders, not tokens.
+MIN_DISTINCT_HEX_CHARS = 10
+# Assets are scanned up to this many bytes; the tail of huge bundles is skipped.
+MAX_ASSET_BYTES = 2_000_000
+
+
+async def fetch_page(url: str) -> Tuple[str, httpx.Headers]:
     client = await get_http_client()
-    resp = await client.get(url, follow_redirects=True)
+    resp = await client.get(url)
     resp.raise_for_status()
-    return resp.text
-
-
-async def fetch_head(url: str):
-    client = await get_http_client()
-    resp = await client.head(url, follow_redirects=True)
-    return resp.headers
+    return resp.text, resp.headers
+
+
+async def _fetch_asset(client: httpx.AsyncClient, url: str, semaphore: asyncio.Semaphore) -> str:
+    async with semaphore:
+        async with client.stream("GET", url, timeout=ASSET_TIMEOUT) as resp:
+            # An error page says nothing about the asset, and its empty result must not be cached.
+            resp.raise_for_status()
+            body = bytearray()
+            async for chunk in resp.aiter_bytes(65536):
+                body += chunk
+                if len(body) >= MAX_ASSET_BYTES:
+                    break
+            del body[MAX_ASSET_BYTES:]
+            # Assets without any context keyword or init call cannot yield candidates; skip the decode.
+            if TOKEN_CONTEXT_BYTES_PATTERN.search(body) is None and INIT_BYTES_PATTERN.search(body) is None:
+                return ""
+            return body.decode(resp.encoding or "utf-8", errors="replace")
 
 
 def _is_shopify(headers, html: str) -> bool:
-    hdr_hit = any(h.lower().startswith(HDR_PREFIXES) for h in headers)
-    html_hit = any(rx.search(html) for rx in HTML_MARKERS)
-    return hdr_hit or html_hit
+    if any(h.startswith(HDR_PREFIXES) for h in headers.keys()):
+        return True
+    return HTML_MARKER_PATTERN.search(html) is not None
 
 
 def _canonical_host(html: str, fallback: str) -> str:
-    for pattern in MYSHOPIFY_PATTERNS:
-        m = pattern.search(html)
-        if m:
-            domain = m.group(2) if len(m.groups()) > 1 and m.group(2) else m.group(1)
-            return domain.lower()
-    shop_pattern = re.search(r"Shopify\.shop\s*=\s*[\"']([^\"']+)[\"']", html)
-    if shop_pattern:
-        shop = shop_pattern.group(1)
-        if ".myshopify.com" in shop:
-            return shop.lower()
-        return f"{shop}.myshopify.com".lower()
-    m = re.search(r"([\w-]+\.myshopify\.com)", html, re.I)
-    if m:
-        return m.group(1).lower()
-    return fallback.lower()
-
-
-def _token_candidates(text: str):
-    lower = text.lower()
-    token_contexts = [
-        "storefront",
-        "token",
-        "access_token",
-        "accesstoken",
-        "apikey",
-        "api_key",
-        "shopify",
-        "graphql",
-        "storefrontaccesstoken",
-        "x-shopify",
-        "publicaccesstoken",
-        "client_id",
-        "clientid",
-    ]
-    init_patterns = [
-        r"ShopifyBuy\.buildClient\({[^}]*}",
-        r"createClient\({[^}]*}",
-        r"Shopify\.loadFeatures\({[^}]*}",
-        r"new Client\({[^}]*}",
-        r"fetch\([^)]*\"/api/[^\"]*\"",
-    ]
-    candidates: List[str] = []
-    for pattern in TOKEN_PATTERNS:
-        for m in pattern.finditer(text):
-            window = lower[max(0, m.start() - 100) : m.end() + 100]
-            if any(ctx in window for ctx in token_contexts):
-                candidates.append(m.group(1))
-            for init in init_patterns:
-                if re.search(init, window):
-                    candidates.append(m.group(1))
-    return candidates
+    m = SHOPIFY_HOST_PATTERN.search(html)
+    if not m:
+        return fallback.lower()
+    shop = m["shop"]
+    if shop is not None:
+        return (shop if ".myshopify.com" in shop.lower() else f"{shop}.myshopify.com").lower()
+    return (m["md"] or m["dom"]).lower()
+
+
+def _token_candidates(text: str) -> Iterator[Tuple[str, int]]:
+    """Yield ``(token, priority)`` pairs; priority 0 means a token-specific keyword was nearby."""
+    # Without any context keyword or init call in the text, no match can qualify.
+    if TOKEN_CONTEXT_PATTERN.search(text) is None and INIT_PATTERN.search(text) is None:
+        return
+    for m in TOKEN_PATTERN.finditer(text):
+        lo, hi = max(0, m.start() - 100), m.end() + 100
+        if TOKEN_CONTEXT_PATTERN.search(text, lo, hi) or INIT_PATTERN.search(text, lo, hi):
+            yield m["hex"] or m["jwt"], 0 if PRIORITY_CONTEXT_PATTERN.search(text, lo, hi) else 1
+
+
+def _merge_candidates(candidates: Dict[str, int], found: Iterable[Tuple[str, int]]) -> None:
+    for tok, priority in found:
+        if priority < candidates.get(tok, 2):
+            candidates[tok] = priority
+
+
+def clear_validation_cache() -> None:
+    """Forget all cached token validations."""
+    _validation_cache.clear()
+
+
+def _is_transient(exc: BaseException) -> bool:
+    """True unless ``exc`` is a definitive client-side rejection (4xx other than throttling) from Shopify."""
+    if not isinstance(exc, httpx.HTTPStatusError):
+        return True
+    status = exc.response.status_code
+    return status >= 500 or status in RETRY_STATUSES
 
 
 async def _validate_token(host: str, token: str, api_version: str = DEFAULT_API_VERSION) -> Dict[str, Any]:
+    key = (host, token, api_version)
+    cached = _validation_cache.get(key)
+    if cached is not None:
+        return cached
     client = GraphQLClient(host=host, token=token, api_version=api_version)
     results = {"valid": False, "permissions": [], "access_denied_errors": []}
-    schema_query = {"query": "{__schema{queryType{name}}}"}
-    permission_tests = [
-        {"name": "unauthenticated_read_product_listings", "query": "{products(first:1){edges{node{id}}}}"},
-        {"name": "cart_create", "query": "mutation{cartCreate(input:{}){cart{id}}}"},
-        {"name": "unauthenticated_read_content", "query": "{shop{name description}}"},
-        {"name": "unauthenticated_read_customer", "query": "mutation{customerAccessTokenCreate(input:{email:\"test@example.com\",password:\"test\"}){customerUserErrors{message}}}"},
-        {"name": "unauthenticated_read_collection_listings", "query": "{collections(first:1){edges{node{id}}}}"},
-        {"name": "product_types_access", "query": "{productTypes(first:1){edges{node}}}"},
-        {"name": "search_access", "query": "{search(query:\"test\",types:PRODUCT,first:1){edges{node{__typename}}}}"},
-        {"name": "metafields_access", "query": "{shop{metafields(first:1){edges{node{id}}}}}"},
-    ]
+    mutation_task = asyncio.ensure_future(client.probe(VALIDATION_MUTATION_FIELDS, "mutation"))
     try:
-        resp = await client.execute(schema_query["query"])
-        if "__schema" in json.dumps(resp):
-            results["valid"] = True
-            for test in permission_tests:
-                try:
-                    data = await client.execute(test["query"])
-                    if data and "errors" not in data:
-                        results["permissions"].append(test["name"])
-                except Exception:
-                    results["access_denied_errors"].append(test["name"])
-    except Exception:
+        try:
+            query_failures: Any = await client.probe(VALIDATION_QUERY_FIELDS)
+        except Exception as exc:
+            query_failures = exc
+        if isinstance(query_failures, BaseException) or "schema" in query_failures:
+            # The token is unusable, so the mutation probe is dropped unheard (see finally).
+            if isinstance(query_failures, BaseException) and _is_transient(query_failures):
+                return {**results, "transient": True}
+            _validation_cache.set(key, results)
+            return results
+        try:
+            mutation_failures: Any = await mutation_task
+        except Exception as exc:
+            mutation_failures = exc
+        results["valid"] = True
+        for name, operation, _ in PERMISSION_TESTS:
+            failures = mutation_failures if operation == "mutation" else query_failures
+            if isinstance(failures, BaseException):
+                results["access_denied_errors"].append(name)
+            elif name not in failures:
+                results["permissions"].append(name)
+            elif any("access denied" in msg.lower() for msg in failures[name]):
+                results["access_denied_errors"].append(name)
+        if isinstance(mutation_failures, BaseException) and _is_transient(mutation_failures):
+            # Reported so the discovery holding this answer is not cached either.
+            return {**results, "transient": True}
+        _validation_cache.set(key, results)
         return results
-    return results
+    finally:
+        # Also covers this validation being cancelled while the query probe is in flight.
+        if not mutation_task.done():
+            mutation_task.cancel()
+        elif not mutation_task.cancelled():
+            mutation_task.exception()  # Marks a failure we chose to ignore as retrieved.
 
 
 def generate_api_guidance(permissions: List[str], access_denied: List[str]) -> Dict[str, Any]:
+    """Return guidance for a token's permissions; the result is shared and must not be mutated."""
+    return _api_guidance(frozenset(permissions), tuple(access_denied))
+
+
+@lru_cache(maxsize=256)
+def _api_guidance(permissions: FrozenSet[str], access_denied: Tuple[str, ...]) -> Dict[str, Any]:
     guidance = {"recommended_approaches": [], "fallback_strategies": [], "operations_to_avoid": [], "example_queries": {}}
     if "unauthenticated_read_product_listings" in permissions:
         guidance["recommended_approaches"].append({"name": "Direct Product Queries", "description": "You can directly query products, variants, and collections"})
-        guidance["example_queries"]["product_query"] = "{ products(first: 10) { edges { node { id title variants(first: 1) { edges { node { id } } } } } } }"
+        guidance["example_queries"]["product_query"] = EXAMPLE_PRODUCT_QUERY
     if "cart_create" in permissions:
         guidance["recommended_approaches"].append({"name": "Cart Operations", "description": "You can create carts and add items with known variant IDs"})
-        guidance["example_queries"]["cart_create"] = "mutation { cartCreate( input: { lines: [ { quantity: 1 merchandiseId: \"gid://shopify/ProductVariant/VARIANT_ID\" } ] } ) { cart { id checkoutUrl } } }"
+        guidance["example_queries"]["cart_create"] = EXAMPLE_CART_CREATE
     if "unauthenticated_read_product_listings" not in permissions and "product_types_access" in permissions:
-        guidance["fallback_strategies"].append({"limitation": "No direct product listing access", "strategy": "Use productTypes + search query approach", "example": "{ productTypes(first: 10) { edges { node } } } { search(query: \"TypeName\", types: [PRODUCT], first: 3) { edges { node { ... on Product { id title variants(first: 1) { edges { node { id } } } } } } } }"})
+        guidance["fallback_strategies"].append({"limitation": "No direct product listing access", "strategy": "Use productTypes + search query approach", "example": EXAMPLE_SEARCH_DISCOVERY})
     for denied in access_denied:
         if denied == "unauthenticated_read_product_listings":
             guidance["operations_to_avoid"].append({"operation": "Direct product queries", "reason": "Token lacks product listing permissions", "suggestion": "Try using search with product types instead"})
     return guidance
 
 
-async def capture_network_tokens(url: str) -> List[str]:
+def capture_network_tokens(html: str) -> List[str]:
+    """Collect tokens found near GraphQL endpoint literals in the page source."""
     candidates: List[str] = []
-    client = await get_http_client()
-    resp = await client.get(url)
-    soup = BeautifulSoup(resp.text, "html.parser")
-    fetch_patterns = [
-        r"fetch\(['\"](https://[^'\"]+graphql[^'\"]*)['\"]",
-        r"url:\s*['\"](https://[^'\"]+graphql[^'\"]*)['\"]",
-        r"endpoint:\s*['\"](https://[^'\"]+graphql[^'\"]*)['\"]",
-    ]
-    for script in soup.find_all("script"):
-        if not script.string:
-            continue
-        for pattern in fetch_patterns:
-            for match in re.finditer(pattern, script.string):
-                window = script.string[max(0, match.start() - 200):match.end() + 200]
-                for token_pattern in TOKEN_PATTERNS:
-                    for token_match in token_pattern.finditer(window):
-                        candidates.append(token_match.group(1))
+    for pattern in FETCH_PATTERNS:
+        for match in pattern.finditer(html):
+            window = html[max(0, match.start() - 200):match.end() + 200]
+            for token_match in TOKEN_PATTERN.finditer(window):
+                candidates.append(token_match["hex"] or token_match["jwt"])
     return candidates
 
 
-async def discover_shopify(url: str, max_assets: int = 30) -> Dict[str, Any]:
+def _is_strong_candidate(token: str) -> bool:
+    """Storefront tokens are 32 lowercase hex chars; JWT-style public tokens also qualify."""
+    return token.startswith("eyJ") or token.islower()
+
+
+def _tier_candidates(candidates: Dict[str, int]) -> Tuple[List[str], List[str]]:
+    """Split candidates into (strong, weak) in priority order, dropping hex that is not
+    token-sized or is a low-entropy placeholder."""
+    strong: List[str] = []
+    weak: List[str] = []
+    for tok in sorted(candidates, key=candidates.__getitem__):
+        if not tok.startswith("eyJ") and (len(tok) != 32 or len(set(tok.lower())) < MIN_DISTINCT_HEX_CHARS):
+            continue
+        (strong if _is_strong_candidate(tok) else weak).append(tok)
+    return strong, weak
+
+
+async def _validate_candidates(result: Dict[str, Any], tokens: List[str], max_valid: Optional[int] = None) -> None:
+    """Validate ``tokens`` into ``result`` in order; stop once ``max_valid`` tokens are valid."""
+    semaphore = asyncio.Semaphore(VALIDATION_CONCURRENCY)
+
+    async def bounded(tok: str) -> Dict[str, Any]:
+        async with semaphore:
+            return await _validate_token(result["host"], tok)
+
+    tasks = {asyncio.ensure_future(bounded(tok)): tok for tok in tokens}
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                tok, validation = tasks[task], task.result()
+                if validation["valid"]:
+                    result["tokens_valid"].append(tok)
+                    result["tokens_ranked"].append({
+                        "token": tok,
+                        "permissions": validation["permissions"],
+                        "access_denied_errors": validation["access_denied_errors"],
+                    })
+                else:
+                    result["tokens_invalid"].append(tok)
+                if validation.get("transient"):
+                    result["notes"].append(f"validation error: {tok} – network or server failure, result may be incomplete")
+            if max_valid is not None and len(result["tokens_valid"]) >= max_valid and pending:
+                result["notes"].append(f"stopped after {max_valid} valid tokens; {len(pending)} candidates not validated")
+                break
+    finally:
+        # Runs on the max_valid stop and when the caller is cancelled; queued probes must not go out.
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+    result["tokens_ranked"].sort(key=lambda x: len(x["permissions"]), reverse=True)
+
+
+async def discover_shopify(
+    url: str, max_assets: int = 30, first_only: bool = False, max_valid: Optional[int] = None
+) -> Dict[str, Any]:
+    """Detect a Shopify storefront at ``url`` and validate the tokens it exposes.
+
+    ``max_valid`` stops validation once that many tokens check out; ``first_only`` is
+    shorthand for ``max_valid=1`` that also skips asset downloads when the page suffices.
+    """
+    if first_only:
+        max_valid = 1
     result: Dict[str, Any] = {
         "shopify": False,
         "host": None,
@@ -193,7 +380,7 @@ async def discover_shopify(url: str, max_assets: int = 30) -> Dict[str, Any]:
         "notes": [],
     }
     try:
-        html, headers = await asyncio.gather(fetch_text(url), fetch_head(url))
+        html, headers = await fetch_page(url)
     except Exception as exc:
         result["notes"].append(f"initial fetch failed: {exc}")
         return result
@@ -202,71 +389,115 @@ async def discover_shopify(url: str, max_assets: int = 30) -> Dict[str, Any]:
     result["shopify"] = True
     result["host"] = _canonical_host(html, urllib.parse.urlparse(url).netloc)
 
-    soup = BeautifulSoup(html, "html.parser")
-    assets: List[str] = []
-    for tag in soup.find_all(["script", "link"]):
-        src = tag.get("src") or tag.get("href")
-        if not src:
-            continue
-        if re.search(r"(cdn\.shopify|/assets/)", src):
-            assets.append(urllib.parse.urljoin(url, src))
+    # Insertion-ordered and duplicate-free; the same bundle is often referenced more than once.
+    assets: Dict[str, None] = {}
+    for tag in ASSET_TAG_PATTERN.finditer(html):
+        src = unescape(tag.group(1))
+        if ASSET_PATTERN.search(src):
+            assets.setdefault(urllib.parse.urljoin(url, src))
         if len(assets) >= max_assets:
             break
 
-    candidates = set(_token_candidates(html))
-
-    json_ld = soup.find_all("script", type="application/ld+json")
-    for script in json_ld:
-        if script.string:
-            candidates.update(_token_candidates(script.string))
-
-    for meta in soup.find_all("meta"):
-        if meta.get("content") and len(meta.get("content", "")) > 20:
-            candidates.update(_token_candidates(meta.get("content", "")))
-
-    for elem in soup.find_all():
-        for attr_name, value in elem.attrs.items():
-            if attr_name.startswith("data-") and isinstance(value, str) and len(value) > 20:
-                candidates.update(_token_candidates(value))
-
-    config_patterns = [
-        r"window\.[A-Za-z0-9_]+\s*=\s*({[^;]+});",
-        r"var\s+[A-Za-z0-9_]+\s*=\s*({[^;]+});",
-        r"const\s+[A-Za-z0-9_]+\s*=\s*({[^;]+});",
-    ]
-    for pattern in config_patterns:
-        for match in re.finditer(pattern, html):
-            candidates.update(_token_candidates(match.group(1)))
+    # Token -> best priority seen; lower is validated first.
+    candidates: Dict[str, int] = {}
+    _merge_candidates(candidates, _token_candidates(html))
+
+    for script in JSON_LD_PATTERN.finditer(html):
+        if script.group(1):
+            _merge_candidates(candidates, _token_candidates(script.group(1)))
+
+    for pattern in (META_CONTENT_PATTERN, DATA_ATTR_PATTERN):
+        for match in pattern.finditer(html):
+            value = unescape(match.group(1) or match.group(2))
+            if len(value) > 20:
+                _merge_candidates(candidates, _token_candidates(value))
+
+    for pattern in CONFIG_PATTERNS:
+        for match in pattern.finditer(html):
+            _merge_candidates(candidates, _token_candidates(match.group(1)))
+
+    # Tokens sitting next to a GraphQL endpoint literal are the strongest evidence there is.
+    _merge_candidates(candidates, ((tok, 0) for tok in capture_network_tokens(html)))
+
+    # With first_only, a strong token already in the page makes the asset downloads unnecessary.
+    validated: Set[str] = set()
+    if first_only:
+        page_strong, _ = _tier_candidates(candidates)
+        await _validate_candidates(result, page_strong, max_valid)
+        validated.update(page_strong)
+        if result["tokens_valid"]:
+            result["notes"].append("valid token found in page HTML; assets not fetched")
+            return result
+
+    to_fetch: List[str] = []
+    for asset_url in assets:
+        cached = _asset_candidate_cache.get(asset_url)
+        if cached is None:
+            to_fetch.append(asset_url)
+        else:
+            _merge_candidates(candidates, cached)
 
     client = await get_http_client()
-    for asset_url in assets:
+    semaphore = asyncio.Semaphore(ASSET_CONCURRENCY)
+
+    async def fetch(asset_url: str) -> Tuple[str, Any]:
         try:
-            txt = (await client.get(asset_url)).text
-            candidates.update(_token_candidates(txt))
+            return asset_url, await _fetch_asset(client, asset_url, semaphore)
         except Exception as exc:
-            result["notes"].append(f"asset error: {asset_url} – {exc}")
+            return asset_url, exc
 
+    # Scan each asset as soon as it arrives so parsing overlaps the slower downloads.
+    downloads = [asyncio.ensure_future(fetch(asset_url)) for asset_url in to_fetch]
     try:
-        network_tokens = await capture_network_tokens(url)
-        candidates.update(network_tokens)
-    except Exception as exc:
-        result["notes"].append(f"network token capture error: {exc}")
-
-    for tok in candidates:
-        validation = await _validate_token(result["host"], tok)
-        if validation["valid"]:
-            result["tokens_valid"].append(tok)
-            result["tokens_ranked"].append({"token": tok, "permissions": validation["permissions"]})
-        else:
-            result["tokens_invalid"].append(tok)
-
-    result["tokens_ranked"].sort(key=lambda x: len(x["permissions"]), reverse=True)
+        for next_asset in asyncio.as_completed(downloads):
+            asset_url, txt = await next_asset
+            if isinstance(txt, Exception):
+                # A definitive 4xx (e.g. a stale link) is part of the store's state; only transient failures
+                # make the run incomplete.
+                prefix = "asset error" if _is_transient(txt) else "asset unavailable"
+                result["notes"].append(f"{prefix}: {asset_url} – {txt}")
+                continue
+            found = tuple(_token_candidates(txt))
+            _asset_candidate_cache.set(asset_url, found)
+            _merge_candidates(candidates, found)
+    finally:
+        # as_completed leaves its tasks running if this coroutine is cancelled.
+        unfinished = [task for task in downloads if not task.done()]
+        for task in unfinished:
+            task.cancel()
+        if unfinished:
+            await asyncio.gather(*unfinished, return_exceptions=True)
+
+    strong, weak = _tier_candidates({tok: p for tok, p in candidates.items() if tok not in validated})
+    await _validate_candidates(result, strong, max_valid)
+    if weak and not result["tokens_valid"]:
+        await _validate_candidates(result, weak, max_valid)
+    elif weak:
+        result["notes"].append(f"skipped {len(weak)} weak token candidates")
     return result
 
 
 @mcp.tool()
-async def shopify_discover(url: str) -> str:
-    result = await discover_shopify(url)
+async def shopify_discover(
+    url: str, first_only: bool = False, use_cache: bool = True, max_valid: Optional[int] = None
+) -> str:
+    """Find and validate Storefront tokens on ``url``; ``first_only`` stops at the first valid token
+    and ``max_valid`` after that many.
+
+    Results are cached per store; pass ``use_cache=False`` to force a fresh discovery.
+    """
+    variant = f"{first_only:d}|{max_valid or 0}"
+    cache_key = f"{urllib.parse.urlparse(url).netloc.lower()}|{variant}"
+    if use_cache:
+        cached = _discovery_cache.get(cache_key)
+        if cached is None:
+            # sqlite IO is blocking, so it runs off the event loop.
+            cached = await asyncio.to_thread(_discovery_disk_cache.get, cache_key)
+            if cached is not None:
+                _discovery_cache.set(cache_key, cached)
+        if cached is not None:
+            return cached
+    result = await discover_shopify(url, first_only=first_only, max_valid=max_valid)
     if result["tokens_valid"]:
         result["api_guidance"] = []
         for token_info in result["tokens_ranked"]:
@@ -275,4 +506,10 @@ async def shopify_discover(url: str) -> str:
             access_denied = token_info.get("access_denied_errors", [])
             guidance = generate_api_guidance(permissions, access_denied)
             result["api_guidance"].append({"token": token, "guidance": guidance})
-    return json.dumps(result)
+    payload = json_dumps(result)
+    # A run hit by a failed download or a network error during validation is not a verdict on the store.
+    if result["shopify"] and not any(note.startswith(UNCACHEABLE_NOTE_PREFIXES) for note in result["notes"]):
+        for key in {cache_key, f"{result['host']}|{variant}"}:
+            _discovery_cache.set(key, payload)
+            await asyncio.to_thread(_discovery_disk_cache.set, key, payload)
+    return payload
@@ -1,14 +1,136 @@
 from __future__ import annotations
-from typing import Any, Dict, Optional
+import asyncio
+import random
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import httpx
 
 from .utils import (
     DEFAULT_API_VERSION,
     ENV_STORE,
     ENV_TOKEN,
     DEFAULT_HEADERS,
+    TTLCache,
     get_http_client,
+    json_bytes,
+    json_loads,
+    no_gc,
+    single_flight,
 )
 
+
+# Throttling (429 rate limit, 430 Shopify security rejection) and transient upstream failures
+# are retried with jittered exponential backoff, or after the server's Retry-After if it sends one.
+# Throttles are rejected before anything runs, so they are safe to retry for any document; a 5xx
+# may arrive after a mutation was applied, so those are only retried for read-only queries.
+THROTTLE_STATUSES = frozenset({429, 430})
+RETRY_STATUSES = THROTTLE_STATUSES | {500, 502, 503, 504}
+MAX_RETRIES = 3
+RETRY_BASE_DELAY = 0.5
+MAX_RETRY_DELAY = 30.0
+
+# Read-only query results are reused briefly; mutations and error responses are never cached.
+RESPONSE_CACHE_TTL = 30.0
+_response_cache = TTLCache(RESPONSE_CACHE_TTL, maxsize=1024)
+# Cacheable queries currently on the wire; identical concurrent calls share one request.
+_inflight_queries: Dict[Any, "asyncio.Future[bytes]"] = {}
+# Mutations sent per (url, token); a read that overlapped one is not cached.
+_mutation_counts: Dict[Tuple[str, str], int] = {}
+
+
+async def cancel_inflight() -> None:
+    """Cancel and await every shared query request still in flight, e.g. before closing the HTTP client."""
+    tasks = list(_inflight_queries.values())
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _is_read_only(query: str) -> bool:
+    # Callers pass the minified form so leading comments cannot hide the operation type.
+    head = query.lstrip()[:5]
+    return head.startswith("{") or head == "query"
+
+
+def _json_content(resp: httpx.Response) -> bytes:
+    # Raw bodies are handed on unparsed, so anything that is not JSON must fail here instead.
+    media_type = resp.headers.get("Content-Type", "").split(";", 1)[0].strip().lower()
+    if media_type != "application/json" and not media_type.endswith("+json"):
+        raise ValueError(f"Expected a JSON response, got {media_type or 'no content type'}")
+    return resp.content
+
+
+def _retry_delay(resp: httpx.Response, attempt: int) -> float:
+    try:
+        delay = float(resp.headers["Retry-After"])
+    except (KeyError, ValueError):
+        delay = RETRY_BASE_DELAY * 2 ** attempt + random.uniform(0, 0.25)
+    return min(max(delay, 0.0), MAX_RETRY_DELAY)
+
+
+# Strings are kept verbatim; comments, commas and whitespace are insignificant and dropped.
+QUERY_TOKEN_PATTERN = re.compile(
+    r'(?P<string>"""(?:\\"""|.)*?"""|"(?:\\.|[^"\\\n])*")'
+    r"|(?P<skip>#[^\n\r]*|[\s,\ufeff]+)"
+    r'|(?P<other>[^\s,#"]+|")',
+    re.S,
+)
+# Characters that would fuse with a neighbouring name or number if the space between them went.
+_WORD_CHARS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_-.")
+
+
+@lru_cache(maxsize=512)
+def minify_query(query: str) -> str:
+    """Strip comments and redundant whitespace from a GraphQL document, leaving strings intact."""
+    out: List[str] = []
+    space = False
+    for m in QUERY_TOKEN_PATTERN.finditer(query):
+        if m.lastgroup == "skip":
+            space = True
+            continue
+        tok = m.group()
+        if space and out and out[-1][-1] in _WORD_CHARS and tok[0] in _WORD_CHARS:
+            out.append(" ")
+        space = False
+        out.append(tok)
+    return "".join(out)
+
+
+@lru_cache(maxsize=64)
+def batch_document(fields: Tuple[Tuple[str, str], ...], operation: str = "query") -> str:
+    """Combine ``(alias, selection)`` pairs into one aliased GraphQL document."""
+    return operation + "{" + " ".join(f"{alias}:{selection}" for alias, selection in fields) + "}"
+
+
+@lru_cache(maxsize=256)
+def _query_body(query: str) -> bytes:
+    # Probe and introspect documents repeat verbatim, so their request bodies are encoded once.
+    return json_bytes({"query": query})
+
+
+@lru_cache(maxsize=64)
+def _headers_for(token: str) -> Dict[str, str]:
+    # Shared per token; httpx copies request headers, so the dict is never mutated.
+    return {
+        "X-Shopify-Storefront-Access-Token": token,
+        "Content-Type": "application/json",
+        **DEFAULT_HEADERS,
+    }
+
+
+def _errors_by_alias(response: Dict[str, Any], aliases: Sequence[str]) -> Dict[str, List[str]]:
+    failures: Dict[str, List[str]] = {}
+    for error in response.get("errors") or ():
+        path = error.get("path") or ()
+        targets = (path[0],) if path and path[0] in aliases else aliases
+        for alias in targets:
+            failures.setdefault(alias, []).append(error.get("message", ""))
+    return failures
+
+
 class GraphQLClient:
     """Async Shopify Storefront GraphQL client."""
 
@@ -17,29 +139,108 @@ class GraphQLClient:
         host: Optional[str] = None,
         token: Optional[str] = None,
         api_version: str = DEFAULT_API_VERSION,
+        client: Optional[httpx.AsyncClient] = None,
     ) -> None:
         self.host = host or (f"{ENV_STORE}.myshopify.com" if ENV_STORE else None)
         self.token = token or ENV_TOKEN
         self.api_version = api_version
+        # Fixed for the client's lifetime, so built once rather than on every request.
+        self._url = f"https://{self.host}/api/{api_version}/graphql.json"
+        self._headers = _headers_for(self.token) if self.token else None
+        # None means the shared pooled client, resolved on first request.
+        self._client = client
 
     async def execute(self, query: str, variables: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        raw = await self.execute_raw(query, variables)
+        with no_gc():
+            return json_loads(raw)
+
+    async def execute_raw(self, query: str, variables: Optional[Dict[str, Any]] = None) -> bytes:
+        """Like ``execute`` but return the response body unparsed, for callers that only pass it on."""
+        # The minified form only classifies and keys the document; the caller's text is what gets
+        # sent, so error locations still point into it.
+        canonical = minify_query(query)
+        # Only plain queries are cacheable; mutations go straight through.
+        if not _is_read_only(canonical):
+            return await self._fetch(query, variables, None)
+        key = (self._url, self.token, canonical, json_bytes(variables) if variables else None)
+        cached = _response_cache.get(key)
+        if cached is not None:
+            return cached
+        return await single_flight(_inflight_queries, key, lambda: self._fetch(query, variables, key))
+
+    async def _fetch(self, query: str, variables: Optional[Dict[str, Any]], key: Any) -> bytes:
+        if key is None:
+            try:
+                return _json_content(await self._post(query, variables, read_only=False))
+            finally:
+                # A mutation (even a failed one) may have changed what cached reads for this store return.
+                store = (self._url, self.token)
+                _mutation_counts[store] = _mutation_counts.get(store, 0) + 1
+                _response_cache.evict(lambda cached: cached[:2] == store)
+        mutations_before = _mutation_counts.get((self._url, self.token), 0)
+        resp = await self._post(query, variables, read_only=True)
+        content = _json_content(resp)
+        if (
+            mutations_before == _mutation_counts.get((self._url, self.token), 0)
+            and b'"errors"' not in content
+            and "no-store" not in resp.headers.get("Cache-Control", "")
+        ):
+            _response_cache.set(key, content)
+        return content
+
+    async def _post(
+        self, query: str, variables: Optional[Dict[str, Any]] = None, read_only: Optional[bool] = None
+    ) -> httpx.Response:
+        """POST ``query``; ``read_only`` (classified from the minified text if omitted) decides 5xx retries."""
         if not self.host or not self.token:
             raise ValueError("Missing host and/or token")
 
-        headers = {
-            "X-Shopify-Storefront-Access-Token": self.token,
-            "Content-Type": "application/json",
-            **DEFAULT_HEADERS,
-        }
-        payload: Dict[str, Any] = {"query": query}
         if variables:
-            payload["variables"] = variables
+            body = json_bytes({"query": query, "variables": variables})
+        else:
+            body = _query_body(query)
 
-        client = await get_http_client()
-        resp = await client.post(
-            f"https://{self.host}/api/{self.api_version}/graphql.json",
-            headers=headers,
-            json=payload,
-        )
+        if read_only is None:
+            read_only = _is_read_only(minify_query(query))
+        retry_statuses = RETRY_STATUSES if read_only else THROTTLE_STATUSES
+        client = self._client or await get_http_client()
+        for attempt in range(MAX_RETRIES + 1):
+            # The shared client follows redirects for page fetches; a redirected POST would silently
+            # become a GET, so a 3xx here is left for raise_for_status to report.
+            resp = await client.post(self._url, headers=self._headers, content=body, follow_redirects=False)
+            if resp.status_code not in retry_statuses or attempt == MAX_RETRIES:
+                break
+            await asyncio.sleep(_retry_delay(resp, attempt))
         resp.raise_for_status()
-        return resp.json()
+        return resp
+
+    async def probe(self, fields: Tuple[Tuple[str, str], ...], operation: str = "query") -> Dict[str, List[str]]:
+        """Run aliased ``fields`` in a single request and return error messages per failing alias.
+
+        If the combined document is rejected as a whole (no ``data``), each field is
+        retried on its own, concurrently, so one field unknown to this API version
+        cannot mask the rest.
+        """
+        aliases = [alias for alias, _ in fields]
+        resp = await self._probe_response(batch_document(fields, operation))
+        if resp.get("data") is not None or len(fields) == 1:
+            return _errors_by_alias(resp, aliases)
+        singles = await asyncio.gather(
+            *(self._probe_response(batch_document((field,), operation)) for field in fields),
+            return_exceptions=True,
+        )
+        failures: Dict[str, List[str]] = {}
+        for alias, single in zip(aliases, singles):
+            if isinstance(single, Exception):
+                failures[alias] = [str(single)]
+            else:
+                failures.update(_errors_by_alias(single, (alias,)))
+        return failures
+
+    async def _probe_response(self, query: str) -> Dict[str, Any]:
+        # Probes only care about errors, so a clean body is never parsed.
+        resp = await self._post(query)
+        if b'"errors"' not in resp.content:
+            return {"data": True}
+        return json_loads(resp.content)
@@ -1,13 +1,107 @@
 from __future__ import annotations
 
 import asyncio
-import json
+import gc
+import re
 import sys
-from typing import Any, Dict, List, Optional
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+try:
+    import uvloop
+except ImportError:  # pragma: no cover - uvloop is an optional speedup (not available on Windows)
+    uvloop = None
 
 from . import mcp
-from .graphql_client import GraphQLClient
-from .utils import DEFAULT_API_VERSION, ENV_STORE, ENV_TOKEN, get_http_client, get_existing_http_client
+from .graphql_client import GraphQLClient, cancel_inflight
+from .utils import (
+    DEFAULT_API_VERSION,
+    ENV_STORE,
+    ENV_TOKEN,
+    INTROSPECT_CACHE_TTL,
+    TTLCache,
+    close_http_client,
+    json_bytes,
+    json_dumps,
+    no_gc,
+    single_flight,
+)
+
+# (alias, selection) pairs probed by introspect; each alias is the component name reported back.
+INTROSPECT_QUERY_FIELDS: Tuple[Tuple[str, str], ...] = (
+    ("shop", "shop{name}"),
+    ("products", "products(first:1){edges{node{id}}}"),
+    ("collections", "collections(first:1){edges{node{id}}}"),
+    ("productTypes", "productTypes(first:1){edges{node}}"),
+    ("search", "search(query:\"test\",types:PRODUCT,first:1){edges{node{__typename}}}"),
+)
+INTROSPECT_MUTATION_FIELDS: Tuple[Tuple[str, str], ...] = (("cart_create", "cartCreate(input:{}){cart{id}}"),)
+
+# Tool responses allocate many short-lived dicts, so the young generation is collected less often.
+GC_THRESHOLD_GEN0 = 50_000
+
+# Batch mode limits: queries per call, and how many of them are on the wire at once.
+MAX_BATCH_QUERIES = 20
+BATCH_CONCURRENCY = 8
+
+# Seconds the startup warm-up waits on the configured store before giving up.
+WARMUP_TIMEOUT = 3.0
+
+# Serialized introspect results keyed by (host, token, api_version).
+_introspect_cache = TTLCache(INTROSPECT_CACHE_TTL, maxsize=128)
+# Introspect runs in progress under the same key; concurrent callers share one set of probes.
+_introspect_inflight: Dict[Tuple[str, str, str], "asyncio.Future[str]"] = {}
+
+# (required, excluded, summary, recommended_workflow, warnings); first match wins.
+GUIDANCE_RULES: Tuple[Tuple[FrozenSet[str], FrozenSet[str], str, Tuple[str, ...], Tuple[str, ...]], ...] = (
+    (
+        frozenset({"products"}),
+        frozenset(),
+        "This token has good product access capabilities.",
+        (
+            "1. Query products directly",
+            "2. Get variant IDs from product queries",
+            "3. Create cart with selected variants",
+        ),
+        (),
+    ),
+    (
+        frozenset({"productTypes", "search"}),
+        frozenset(),
+        "This token has limited access but can discover products via search.",
+        (
+            "1. Query product types to discover categories",
+            "2. Use search with product types to find products",
+            "3. Extract variant IDs from search results",
+        ),
+        (),
+    ),
+    (
+        frozenset({"cart_create"}),
+        frozenset({"products"}),
+        "This token can only create carts but cannot access products directly.",
+        (),
+        ("Product discovery is severely limited. You may need variant IDs from another source.",),
+    ),
+)
+
+
+# (error message pattern, query pattern, suggestion); a suggestion applies when both match.
+ERROR_RULES: Tuple[Tuple[re.Pattern, re.Pattern, str], ...] = (
+    (
+        re.compile("Access denied"),
+        re.compile("products"),
+        "Token lacks permissions to access products directly. Try using search instead.",
+    ),
+)
+
+
+# Error responses are formatted directly instead of building and serializing a dict each time.
+_ERR_TEMPLATE = '{"errors":[{"message":%s}]}'
+
+
+def _err(message: str) -> str:
+    return _ERR_TEMPLATE % json_dumps(message)
 
 
 @mcp.tool()
@@ -18,117 +112,223 @@ async def shopify_storefront_graphql(
     query: Optional[str] = None,
     variables: Optional[Dict[str, Any]] = None,
     api_version: str = DEFAULT_API_VERSION,
+    queries: Optional[List[Dict[str, Any]]] = None,
 ) -> str:
-    """Execute Shopify Storefront GraphQL queries."""
+    """Execute Shopify Storefront GraphQL queries.
+
+    ``mode="batch"`` runs ``queries`` (each ``{"name", "query", "variables"}``) concurrently.
+    """
     host = host or (f"{ENV_STORE}.myshopify.com" if ENV_STORE else None)
     token = token or ENV_TOKEN
     if not all([host, token]):
-        return json.dumps({"errors": [{"message": "Missing host and/or token"}]})
-
-    client = GraphQLClient(host=host, token=token, api_version=api_version)
-
-    if mode == "execute":
-        if not query:
-            return json.dumps({"errors": [{"message": "Query is required for execute mode"}]})
-        try:
-            data = await client.execute(query, variables)
-            return json.dumps(data)
-        except Exception as exc:
-            return json.dumps({"errors": [{"message": str(exc)}]})
-
-    elif mode == "test":
-        if not query:
-            return json.dumps({"errors": [{"message": "Query is required for test mode"}]})
-        result = {"success": False, "data": None, "errors": None, "guidance": None}
-        try:
-            data = await client.execute(query)
-            result["data"] = data.get("data")
-            result["errors"] = data.get("errors")
-            if data.get("errors") is None:
-                result["success"] = True
-            else:
-                result["guidance"] = analyze_errors_and_suggest(query, data.get("errors"))
-        except Exception as exc:
-            result["errors"] = [{"message": str(exc)}]
-            result["guidance"] = {"suggestion": "Network or server error occurred"}
-        return json.dumps(result)
-
-    elif mode == "introspect":
-        test_components = [
-            {"name": "shop", "query": "{shop{name}}"},
-            {"name": "products", "query": "{products(first:1){edges{node{id}}}}"},
-            {"name": "collections", "query": "{collections(first:1){edges{node{id}}}}"},
-            {"name": "productTypes", "query": "{productTypes(first:1){edges{node}}}"},
-            {"name": "search", "query": "{search(query:\"test\",types:PRODUCT,first:1){edges{node{__typename}}}}"},
-            {"name": "cart_create", "query": "mutation{cartCreate(input:{}){cart{id}}}"},
-        ]
-        results = {
-            "accessible_components": [],
-            "inaccessible_components": [],
-        }
-        for comp in test_components:
+        return _err("Missing host and/or token")
+
+    handler = _MODES.get(mode)
+    if handler is None:
+        return _err(f"Invalid mode: {mode}")
+    return await handler(_get_gql_client(host, token, api_version), query, variables, queries)
+
+
+@lru_cache(maxsize=32)
+def _get_gql_client(host: str, token: str, api_version: str) -> GraphQLClient:
+    # Reused across tool calls so the prebuilt URL and headers are not rebuilt each time.
+    return GraphQLClient(host=host, token=token, api_version=api_version)
+
+
+async def _do_execute(
+    client: GraphQLClient,
+    query: Optional[str],
+    variables: Optional[Dict[str, Any]],
+    queries: Optional[List[Dict[str, Any]]],
+) -> str:
+    if not query:
+        return _err("Query is required for execute mode")
+    try:
+        # The upstream body is already JSON, so it is passed on without a parse/serialize round trip.
+        raw = await client.execute_raw(query, variables)
+        return raw.decode()
+    except Exception as exc:
+        return _err(str(exc))
+
+
+async def _do_test(
+    client: GraphQLClient,
+    query: Optional[str],
+    variables: Optional[Dict[str, Any]],
+    queries: Optional[List[Dict[str, Any]]],
+) -> str:
+    if not query:
+        return _err("Query is required for test mode")
+    result = {"success": False, "data": None, "errors": None, "guidance": None}
+    try:
+        data = await client.execute(query)
+        errors = data.get("errors")
+        result["data"] = data.get("data")
+        result["errors"] = errors
+        if errors is None:
+            result["success"] = True
+        else:
+            result["guidance"] = analyze_errors_and_suggest(query, errors)
+    except Exception as exc:
+        result["errors"] = [{"message": str(exc)}]
+        result["guidance"] = {"suggestion": "Network or server error occurred"}
+    with no_gc():
+        return json_dumps(result)
+
+
+async def _do_introspect(
+    client: GraphQLClient,
+    query: Optional[str],
+    variables: Optional[Dict[str, Any]],
+    queries: Optional[List[Dict[str, Any]]],
+) -> str:
+    cache_key = (client.host, client.token, client.api_version)
+    cached = _introspect_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    return await single_flight(_introspect_inflight, cache_key, lambda: _introspect(client, cache_key))
+
+
+async def _do_batch(
+    client: GraphQLClient,
+    query: Optional[str],
+    variables: Optional[Dict[str, Any]],
+    queries: Optional[List[Dict[str, Any]]],
+) -> str:
+    if not queries:
+        return _err("Queries are required for batch mode")
+    if len(queries) > MAX_BATCH_QUERIES:
+        return _err(f"Batch mode accepts at most {MAX_BATCH_QUERIES} queries")
+    if not all(isinstance(item, dict) and item.get("query") for item in queries):
+        return _err("Every batch entry needs a query")
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run(item: Dict[str, Any]) -> bytes:
+        async with semaphore:
             try:
-                data = await client.execute(comp["query"])
-                if data.get("errors"):
-                    results["inaccessible_components"].append(comp["name"])
-                else:
-                    results["accessible_components"].append(comp["name"])
-            except Exception:
-                results["inaccessible_components"].append(comp["name"])
-        guidance = generate_guidance_from_components(
-            results["accessible_components"],
-            results["inaccessible_components"],
-        )
-        results["workflow_guidance"] = guidance
-        return json.dumps(results)
-
-    return json.dumps({"errors": [{"message": f"Invalid mode: {mode}"}]})
+                return await client.execute_raw(item["query"], item.get("variables"))
+            except Exception as exc:
+                return _err(str(exc)).encode()
+
+    bodies = await asyncio.gather(*(run(item) for item in queries))
+    # Upstream bodies are spliced in as-is rather than parsed and re-serialized.
+    entries = (
+        b'{"name":' + json_bytes(item.get("name", str(i))) + b',"response":' + body + b"}"
+        for i, (item, body) in enumerate(zip(queries, bodies))
+    )
+    return (b'{"results":[' + b",".join(entries) + b"]}").decode()
+
+
+async def _introspect(client: GraphQLClient, cache_key: Tuple[str, str, str]) -> str:
+    probes = await asyncio.gather(
+        client.probe(INTROSPECT_QUERY_FIELDS),
+        client.probe(INTROSPECT_MUTATION_FIELDS, "mutation"),
+        return_exceptions=True,
+    )
+    results = {
+        "accessible_components": [],
+        "inaccessible_components": [],
+    }
+    for components, failures in zip((INTROSPECT_QUERY_FIELDS, INTROSPECT_MUTATION_FIELDS), probes):
+        for name, _ in components:
+            if isinstance(failures, BaseException) or name in failures:
+                results["inaccessible_components"].append(name)
+            else:
+                results["accessible_components"].append(name)
+    guidance = generate_guidance_from_components(
+        frozenset(results["accessible_components"]),
+        frozenset(results["inaccessible_components"]),
+    )
+    results["workflow_guidance"] = guidance
+    payload = json_dumps(results)
+    # A network failure says nothing about the token, so only clean runs are cached.
+    if not any(isinstance(failures, BaseException) for failures in probes):
+        _introspect_cache.set(cache_key, payload)
+    return payload
+
+
+_MODES: Dict[str, Callable[..., Awaitable[str]]] = {
+    "execute": _do_execute,
+    "test": _do_test,
+    "introspect": _do_introspect,
+    "batch": _do_batch,
+}
 
 
 def analyze_errors_and_suggest(query: str, errors: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Suggest workarounds for ``errors``; the result is shared and must not be mutated."""
+    # Each rule's query condition is checked once per call, not once per error.
+    rules = tuple(i for i, (_, query_pattern, _) in enumerate(ERROR_RULES) if query_pattern.search(query))
+    if not rules:
+        return _suggestions_for((), ())
+    return _suggestions_for(rules, tuple(error.get("message", "") for error in errors))
+
+
+@lru_cache(maxsize=256)
+def _suggestions_for(rules: Tuple[int, ...], messages: Tuple[str, ...]) -> Dict[str, Any]:
     guidance = {"suggestions": [], "alternative_queries": []}
-    for error in errors:
-        msg = error.get("message", "")
-        if "Access denied" in msg and "products" in query:
-            guidance["suggestions"].append(
-                "Token lacks permissions to access products directly. Try using search instead."
-            )
+    # Each rule contributes its suggestion at most once; stop once every applicable rule has fired.
+    pending = list(rules)
+    for msg in messages:
+        for i in tuple(pending):
+            message_pattern, _, suggestion = ERROR_RULES[i]
+            if message_pattern.search(msg):
+                guidance["suggestions"].append(suggestion)
+                pending.remove(i)
+        if not pending:
+            break
     return guidance
 
 
-def generate_guidance_from_components(accessible: List[str], inaccessible: List[str]) -> Dict[str, Any]:
-    guidance = {"summary": "", "recommended_workflow": [], "warnings": []}
-    if "products" in accessible:
-        guidance["summary"] = "This token has good product access capabilities."
-        guidance["recommended_workflow"] = [
-            "1. Query products directly",
-            "2. Get variant IDs from product queries",
-            "3. Create cart with selected variants",
-        ]
-    elif "productTypes" in accessible and "search" in accessible:
-        guidance["summary"] = "This token has limited access but can discover products via search."
-        guidance["recommended_workflow"] = [
-            "1. Query product types to discover categories",
-            "2. Use search with product types to find products",
-            "3. Extract variant IDs from search results",
-        ]
-    elif "cart_create" in accessible and "products" not in accessible:
-        guidance["summary"] = "This token can only create carts but cannot access products directly."
-        guidance["warnings"].append(
-            "Product discovery is severely limited. You may need variant IDs from another source."
-        )
-    return guidance
+def generate_guidance_from_components(
+    accessible: Iterable[str], inaccessible: Iterable[str]
+) -> Dict[str, Any]:
+    """Pick the workflow guidance for ``accessible``; the result is shared and must not be mutated."""
+    return _guidance_for(frozenset(accessible))
+
+
+@lru_cache(maxsize=64)
+def _guidance_for(accessible: FrozenSet[str]) -> Dict[str, Any]:
+    for required, excluded, summary, workflow, warnings in GUIDANCE_RULES:
+        if required <= accessible and not excluded & accessible:
+            return {"summary": summary, "recommended_workflow": list(workflow), "warnings": list(warnings)}
+    return {"summary": "", "recommended_workflow": [], "warnings": []}
+
+
+async def _warm_up() -> None:
+    """Open a connection to the configured store with a read-only probe."""
+    client = _get_gql_client(f"{ENV_STORE}.myshopify.com", ENV_TOKEN, DEFAULT_API_VERSION)
+    try:
+        # Query fields only: the cartCreate probe would create a real cart on every start.
+        await asyncio.wait_for(client.probe(INTROSPECT_QUERY_FIELDS), WARMUP_TIMEOUT)
+    except Exception as exc:
+        print(f"Warm-up probe failed: {exc!r}", file=sys.stderr)
+
+
+async def _serve() -> None:
+    warm_up = asyncio.create_task(_warm_up()) if ENV_STORE and ENV_TOKEN else None
+    try:
+        await mcp.run_stdio_async()
+    finally:
+        # Shared in-flight work must stop before the client it is using is closed under it.
+        pending = [task for task in (warm_up, *_introspect_inflight.values()) if task]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        await cancel_inflight()
+        # Closed on the loop that owns its connections; asyncio.run then shuts down async generators.
+        await close_http_client()
 
 
 def main() -> None:
     if not ENV_STORE or not ENV_TOKEN:
         print("ℹ️  ENV credentials not set – server will rely on runtime host/token.", file=sys.stderr)
-    try:
-        mcp.run(transport="stdio")
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    gc.set_threshold(GC_THRESHOLD_GEN0, 10, 10)
+    # Same as mcp.run(transport="stdio"), but on a loop shared with the warm-up task.
+    asyncio.run(_serve())
+
 
-    finally:
-        client = get_existing_http_client()
-        if client:
-            asyncio.run(client.aclose())
 if __name__ == "__main__":
     main()
@@ -1,32 +1,210 @@
 from __future__ import annotations
+import asyncio
+import gc
+import importlib.util
+import json
 import os
-from typing import Optional
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterator, Optional, Tuple, Union
 
 import httpx
-from dotenv import load_dotenv
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is an optional speedup
+    orjson = None
 
 # Load environment variables
 ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-load_dotenv(os.path.join(ROOT_DIR, ".env"))
+ENV_FILE_PATH = os.getenv("SHOPIFY_ENV_FILE") or os.path.join(ROOT_DIR, ".env")
+CACHE_DIR = os.path.join(ROOT_DIR, ".cache")
+# Deployments that export the credentials skip reading (and importing) dotenv entirely.
+if not (os.getenv("SHOPIFY_STOREFRONT_ACCESS_TOKEN") and os.getenv("SHOPIFY_STORE_NAME")):
+    from dotenv import load_dotenv
+
+    load_dotenv(ENV_FILE_PATH)
 
 ENV_TOKEN: Optional[str] = os.getenv("SHOPIFY_STOREFRONT_ACCESS_TOKEN")
 ENV_STORE: Optional[str] = os.getenv("SHOPIFY_STORE_NAME")
 DEFAULT_API_VERSION = os.getenv("SHOPIFY_API_VERSION", "2025-04")
+# Seconds an introspect result is reused for the same credentials; 0 disables the cache.
+INTROSPECT_CACHE_TTL = float(os.getenv("SHOPIFY_INTROSPECT_CACHE_TTL", "600"))
 
 DEFAULT_HEADERS = {
     "User-Agent": "ShopifyMCP/0.2 (+https://example.com)"
 }
 
+# HTTP/2 needs the optional h2 package (pip install "httpx[http2]").
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=30.0)
+# Fail fast on unreachable hosts without cutting short slow GraphQL responses.
+HTTP_TIMEOUT = httpx.Timeout(15.0, connect=5.0)
+
 _http_client: Optional[httpx.AsyncClient] = None
 
+
+def json_dumps(obj: Any, indent: bool = False) -> str:
+    """Serialize ``obj`` to a JSON string, using orjson when it is installed."""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        try:
+            return orjson.dumps(obj, option=option).decode()
+        except TypeError:
+            # e.g. integers beyond 64 bits, which the stdlib encoder handles.
+            pass
+    return json.dumps(obj, indent=2 if indent else None)
+
+
+def json_bytes(obj: Any) -> bytes:
+    """Serialize ``obj`` straight to UTF-8 JSON bytes, e.g. for a request body."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass
+    return json.dumps(obj).encode()
+
+
+def json_loads(data: Union[bytes, str]) -> Any:
+    """Parse a JSON document, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+@contextmanager
+def no_gc() -> Iterator[None]:
+    """Pause cyclic GC for a synchronous burst of short-lived allocations, e.g. parsing a large response.
+
+    Never hold it across an ``await``: other tasks would run with collection disabled too.
+    """
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+class TTLCache:
+    """Size-bounded LRU mapping whose entries expire ``ttl`` seconds after being set."""
+
+    def __init__(self, ttl: float, maxsize: int = 128) -> None:
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: OrderedDict[Hashable, Tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        if time.monotonic() - entry[0] >= self.ttl:
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._data[key] = (time.monotonic(), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def evict(self, predicate: Callable[[Hashable], bool]) -> None:
+        """Drop every entry whose key satisfies ``predicate``."""
+        for key in [key for key in self._data if predicate(key)]:
+            del self._data[key]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+class DiskCache:
+    """SQLite-backed string store whose entries expire ``ttl`` seconds after being set; survives restarts."""
+
+    def __init__(self, path: str, ttl: float) -> None:
+        self.path = path
+        self.ttl = ttl
+        self._conn: Optional[sqlite3.Connection] = None
+        # Callers may run get/set in worker threads; one connection is shared, so access is serialized.
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        # Opened on first use so importing the server never touches the disk.
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, expires REAL, value TEXT)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    # Best effort throughout: a corrupt, locked or unwritable database reads as a miss and skips writes.
+    def get(self, key: str) -> Optional[str]:
+        # Wall-clock expiry, since entries outlive the process.
+        try:
+            with self._lock:
+                row = self._connection().execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+        except (sqlite3.Error, OSError):
+            return None
+        if row is None or row[1] < time.time():
+            return None
+        return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connection()
+                with conn:
+                    conn.execute("DELETE FROM cache WHERE expires < ?", (now,))
+                    conn.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?)", (key, now + self.ttl, value))
+        except (sqlite3.Error, OSError):
+            pass
+
+
+async def single_flight(
+    inflight: Dict[Hashable, "asyncio.Future[Any]"], key: Hashable, factory: Callable[[], Awaitable[Any]]
+) -> Any:
+    """Await ``factory()`` once per ``key`` among concurrent callers, sharing its result or exception."""
+    task = inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(factory())
+        inflight[key] = task
+        task.add_done_callback(lambda _: inflight.pop(key, None))
+    # Shielded so one caller being cancelled does not cancel the work the others wait on.
+    return await asyncio.shield(task)
+
+
 async def get_http_client() -> httpx.AsyncClient:
     """Return a shared AsyncClient instance."""
+    # Construction never awaits, so concurrent first callers cannot build two clients.
     global _http_client
     if _http_client is None:
-        _http_client = httpx.AsyncClient(headers=DEFAULT_HEADERS, timeout=15.0)
+        _http_client = httpx.AsyncClient(
+            headers=DEFAULT_HEADERS,
+            timeout=HTTP_TIMEOUT,
+            follow_redirects=True,
+            # Passed to the client rather than via a custom transport so HTTP(S)_PROXY/NO_PROXY still apply.
+            http2=HTTP2_AVAILABLE,
+            limits=HTTP_LIMITS,
+        )
     return _http_client
 
 
 def get_existing_http_client() -> Optional[httpx.AsyncClient]:
     """Return the client if it has been created."""
     return _http_client
+
+
+async def close_http_client() -> None:
+    """Close the shared client, if any; the next get_http_client call builds a new one."""
+    global _http_client
+    client, _http_client = _http_client, None
+    if client is not None:
+        await client.aclose()